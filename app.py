@@ -1,81 +1,214 @@
 import os
+import time
+import asyncio
 import logging
-from flask import Flask, request
+from collections import OrderedDict
+from quart import Quart, request
+from quart.utils import run_sync
+from twilio.request_validator import RequestValidator
+from twilio.twiml.messaging_response import MessagingResponse
 
 import config
 from logs.logger_setup import setup_logging
-from utils.ocr_processor import process_media, parse_extracted_text
+from utils.ocr_processor import process_media, parse_extracted_text, close_http_client, is_supported_media
 from utils.twilio_client import send_confirmation, handle_text_message
 from utils.file_manager import save_guardia
 
-app = Flask(__name__)
+app = Quart(__name__)
 
-# Configurar el logging para capturar eventos y errores, y almacenarlos en logs/app.log
-if not os.path.exists('logs'):
-    os.makedirs('logs')
+# Tiempo (en segundos) que Quart espera a las tareas en segundo plano pendientes al detenerse
+# (por ejemplo, en un despliegue o reinicio); pasado ese plazo las cancela. Debe ser menor que
+# el --graceful-timeout de Gunicorn (ver Procfile, variable GRACEFUL_TIMEOUT): Uvicorn primero
+# drena las conexiones y recién después Quart espera las tareas, y Gunicorn envía SIGKILL al
+# cumplirse su plazo. El margen de 5 segundos permite cancelar las tareas, ejecutar
+# after_serving y vaciar la cola de logs antes de que el proceso sea terminado.
+# Las tareas viven solo en memoria: no hay cola persistente, por lo que un OCR cancelado
+# se pierde y, como Twilio ya recibió el 200, no se reintenta y el usuario no recibe respuesta.
+app.config["BACKGROUND_TASK_SHUTDOWN_TIMEOUT"] = max(int(os.getenv("GRACEFUL_TIMEOUT", "30")) - 5, 1)
 
-logging.basicConfig(
-    filename='logs/app.log',
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-)
+# Mensajes con medios ya recibidos, indexados por MessageSid (valor: instante de recepción).
+# Twilio reintenta el webhook si la respuesta tarda o falla; si el mismo mensaje ya se está
+# procesando o se procesó hace poco, no se agenda otra tarea, evitando enviar al usuario
+# confirmaciones duplicadas. Solo se usa desde el event loop y es local a cada proceso.
+MESSAGE_DEDUP_TTL = 600
+MESSAGE_DEDUP_MAX_ENTRIES = 1024
+_RECENT_MESSAGES = OrderedDict()
+
+# Validador de la firma X-Twilio-Signature, calculada por Twilio con el token de autenticación
+_VALIDATOR = RequestValidator(os.getenv("TWILIO_AUTH_TOKEN", ""))
+
+# Configurar el logging para capturar eventos y errores, y almacenarlos en logs/app.log.
+# La escritura se hace desde un hilo en segundo plano para no bloquear el event loop.
+setup_logging()
 app.logger.setLevel(logging.INFO)
 app.logger.info("Aplicación iniciada correctamente.")
 
+@app.after_serving
+async def shutdown():
+    """
+    Libera los recursos compartidos (cliente HTTP de descargas) al detener el servidor.
+    """
+    await close_http_client()
+
+def is_duplicate_message(message_sid):
+    """
+    Registra un MessageSid e indica si ya se había recibido dentro de MESSAGE_DEDUP_TTL segundos.
+    
+    Args:
+        message_sid (str): Identificador del mensaje enviado por Twilio (parámetro MessageSid).
+    
+    Returns:
+        bool: True si el mensaje ya se está procesando o se procesó recientemente.
+    """
+    if not message_sid:
+        return False
+    now = time.monotonic()
+    # Descartar las entradas vencidas (las más antiguas están al inicio)
+    while _RECENT_MESSAGES and now - next(iter(_RECENT_MESSAGES.values())) > MESSAGE_DEDUP_TTL:
+        _RECENT_MESSAGES.popitem(last=False)
+    if message_sid in _RECENT_MESSAGES:
+        return True
+    _RECENT_MESSAGES[message_sid] = now
+    if len(_RECENT_MESSAGES) > MESSAGE_DEDUP_MAX_ENTRIES:
+        _RECENT_MESSAGES.popitem(last=False)
+    return False
+
+async def process_media_task(media, sender):
+    """
+    Tarea en segundo plano que procesa los medios recibidos y envía la confirmación al usuario.
+    
+    Se ejecuta después de responder al webhook de Twilio, de modo que la descarga, el OCR
+    y el envío del mensaje no cuentan dentro del tiempo límite de la petición.
+    La tarea no es persistente: si el servidor se detiene y no termina dentro de
+    BACKGROUND_TASK_SHUTDOWN_TIMEOUT, se cancela y el mensaje no se procesa.
+    Los archivos (Twilio admite hasta 10 por mensaje) se procesan en paralelo y el texto
+    extraído de todos ellos se combina antes de analizarlo; por ejemplo, el anverso y el
+    reverso de una cédula enviados en el mismo mensaje.
+    
+    Args:
+        media (list): Pares (URL, tipo de contenido) de los archivos a procesar
+            (parámetros MediaUrlN y MediaContentTypeN del webhook).
+        sender (str): Número del remitente al que se enviará la confirmación.
+    """
+    try:
+        # Descargar y procesar todos los medios a la vez (preprocesamiento y OCR).
+        # Las descargas no bloquean el event loop y el OCR se ejecuta en el pool de hilos.
+        results = await asyncio.gather(
+            *(process_media(media_url, content_type=content_type) for media_url, content_type in media),
+            return_exceptions=True
+        )
+        
+        # Registrar los archivos que fallaron y conservar el texto de los demás.
+        # Se usa BaseException para incluir asyncio.CancelledError (por ejemplo, si se cancela
+        # un procesamiento compartido en curso), que no hereda de Exception.
+        texts = []
+        for (media_url, _), result in zip(media, results):
+            if isinstance(result, BaseException):
+                app.logger.error("Error procesando el archivo desde %s: %s", media_url, str(result))
+            else:
+                texts.append(result)
+        if not texts:
+            return
+        
+        extracted_text = "\n".join(texts)
+        app.logger.info("Texto extraído mediante OCR: %s", extracted_text)
+        
+        # Analizar el texto extraído para obtener datos relevantes (por ejemplo, nombre, apellidos, RUT)
+        data = parse_extracted_text(extracted_text)
+        app.logger.info("Datos extraídos: %s", data)
+        
+        # Enviar un mensaje de confirmación al usuario con los datos extraídos
+        # (el cliente de Twilio es síncrono, por lo que se ejecuta fuera del event loop)
+        await run_sync(send_confirmation)(data, sender)
+        
+        # Opcional: guardar los datos en un archivo JSON si el usuario posteriormente confirma la información
+        # save_guardia(data)
+    except Exception as e:
+        # La respuesta al webhook ya fue enviada, por lo que solo se registra el error
+        app.logger.error("Error procesando los archivos de %s: %s", sender, str(e))
+
 @app.route("/")
-def index():
+async def index():
     """
     Endpoint raíz para confirmar que la aplicación se despliega correctamente.
     """
     return "¡Hola, mundo! La aplicación se desplegó correctamente."
 
 @app.route("/incoming", methods=["POST"])
-def incoming():
+async def incoming():
     """
     Endpoint para recibir mensajes entrantes de Twilio.
     
+    Antes de cualquier otro procesamiento se valida la firma X-Twilio-Signature; las peticiones
+    que no provienen de Twilio se rechazan con 403 sin descargar ni procesar ningún archivo.
+    
     Este endpoint diferencia entre mensajes que incluyen medios (imágenes, PDFs) y mensajes de texto.
-    - Si hay medios adjuntos (verificado con el parámetro NumMedia), se descarga el archivo,
-      se preprocesa y se aplica OCR para extraer el texto. Luego se analizan los datos y se envía un mensaje
-      de confirmación al usuario.
+    - Los medios que no son imágenes ni PDFs (según MediaContentTypeN) se descartan sin descargarlos;
+      si ninguno se puede procesar, se informa al usuario.
+    - Si hay medios adjuntos (verificado con el parámetro NumMedia), se agenda una tarea en segundo
+      plano que descarga los archivos, los preprocesa y aplica OCR para extraer el texto, analiza los datos
+      y envía un mensaje de confirmación al usuario. El webhook responde de inmediato con un TwiML vacío
+      para no exceder el tiempo límite de Twilio (lo que provocaría reintentos).
     - Si no hay medios, se procesa el texto recibido (por ejemplo, para manejar confirmaciones o comandos).
     """
     try:
-        # Registrar la información recibida para fines de depuración
-        app.logger.info("Mensaje entrante recibido: %s", request.form)
+        # En Quart el formulario se lee de forma asíncrona
+        form = await request.form
+
+        # Verificar que la petición proviene de Twilio. request.url no incluye el fragmento (#...)
+        # con las opciones de conexión configuradas en el webhook, tal como lo firma Twilio.
+        signature = request.headers.get("X-Twilio-Signature", "")
+        if not _VALIDATOR.validate(request.url, form, signature):
+            app.logger.warning("Petición rechazada por firma de Twilio inválida.")
+            return "", 403
+
+        # Registrar la información recibida para fines de depuración (solo si el nivel DEBUG está activo)
+        if app.logger.isEnabledFor(logging.DEBUG):
+            app.logger.debug("Mensaje entrante recibido: %s", form)
         
-        # Obtener el número de medios enviados (por defecto es 0 si no se especifica)
-        num_media = int(request.form.get("NumMedia", 0))
-        # Obtener el número de teléfono del remitente (usado para enviar respuestas)
-        sender = request.form.get("From")
+        # Leer una sola vez los campos del formulario que se utilizan
+        # Número de medios enviados (por defecto es 0 si no se especifica)
+        num_media = int(form.get("NumMedia", 0))
+        # Número de teléfono del remitente (usado para enviar respuestas)
+        sender = form.get("From")
+        # Identificador del mensaje, igual en todos los reintentos del mismo webhook
+        message_sid = form.get("MessageSid")
+        # URLs y tipos de contenido de los archivos adjuntos (MediaUrlN / MediaContentTypeN)
+        media = [
+            (form.get(f"MediaUrl{i}"), form.get(f"MediaContentType{i}", ""))
+            for i in range(num_media)
+        ]
         
         if num_media > 0:
-            # Si se adjuntó un archivo (imagen o PDF)
-            media_url = request.form.get("MediaUrl0")
-            app.logger.info("Procesando archivo desde URL: %s", media_url)
-            
-            # Llamar a la función que descarga y procesa el medio (preprocesamiento y OCR)
-            extracted_text = process_media(media_url)
-            app.logger.info("Texto extraído mediante OCR: %s", extracted_text)
+            # Descartar los medios que no se pueden procesar con OCR (audio, video, etc.)
+            supported_media = [item for item in media if is_supported_media(item[1])]
+            if not supported_media:
+                app.logger.info("Medios no soportados recibidos: %s", [item[1] for item in media])
+                # Responder directamente en el TwiML del webhook (sin una llamada adicional a la API)
+                resp = MessagingResponse()
+                resp.message("Solo acepto imágenes o archivos PDF. Por favor, envíe una foto o un PDF de su documento.")
+                return str(resp), 200, {"Content-Type": "text/xml"}
             
-            # Analizar el texto extraído para obtener datos relevantes (por ejemplo, nombre, apellidos, RUT)
-            data = parse_extracted_text(extracted_text)
-            app.logger.info("Datos extraídos: %s", data)
+            # Si Twilio reintenta un mensaje ya recibido, no se vuelve a procesar ni a confirmar
+            if is_duplicate_message(message_sid):
+                app.logger.info("Mensaje %s duplicado (reintento de Twilio); se omite.", message_sid)
+                return str(MessagingResponse()), 200, {"Content-Type": "text/xml"}
             
-            # Enviar un mensaje de confirmación al usuario con los datos extraídos
-            send_confirmation(data, sender)
+            # Si se adjuntaron archivos (imágenes o PDFs)
+            app.logger.info("Procesando %d archivo(s) desde URL: %s", len(supported_media), supported_media)
             
-            # Opcional: guardar los datos en un archivo JSON si el usuario posteriormente confirma la información
-            # save_guardia(data)
+            # Procesar los medios en segundo plano (en memoria, sin cola persistente) y
+            # responder a Twilio sin esperar el OCR
+            app.add_background_task(process_media_task, supported_media, sender)
             
-            return "Mensaje de medios procesado", 200
+            return str(MessagingResponse()), 200, {"Content-Type": "text/xml"}
         else:
             # Si el mensaje no contiene archivos, se procesa el contenido de texto
-            body = request.form.get("Body", "").strip().lower()
+            body = form.get("Body", "").strip().lower()
             app.logger.info("Procesando mensaje de texto: %s", body)
             
             # Manejar el mensaje de texto (por ejemplo, confirmaciones, comandos de consulta o eliminación)
-            handle_text_message(body, sender)
+            await run_sync(handle_text_message)(body, sender)
             
             return "Mensaje de texto procesado", 200
     except Exception as e:
@@ -84,8 +217,10 @@ def incoming():
         return "Error procesando mensaje", 500
 
 if __name__ == "__main__":
-    # Ejecutar la aplicación en modo de desarrollo.
-    # En producción se recomienda utilizar un servidor WSGI (por ejemplo, Gunicorn)
-    setup_logging()
+    # Ejecutar la aplicación en modo de desarrollo con Uvicorn.
+    # En producción se recomienda utilizar Gunicorn con workers de Uvicorn (ver Procfile):
+    #   gunicorn app:app -k uvicorn.workers.UvicornWorker
+    import uvicorn
+
     port = int(os.environ.get("PORT", 5000))
-    app.run(host="0.0.0.0", port=port)
+    uvicorn.run("app:app", host="0.0.0.0", port=port, loop="uvloop")
@@ -15,10 +15,11 @@ class Config:
     """
     
     # ------------------------
-    # Configuración de Flask
+    # Configuración de Quart
     # ------------------------
-    # Modo de depuración: se habilita si la variable FLASK_DEBUG es "True", "1" o "yes"
-    DEBUG = os.getenv("FLASK_DEBUG", "False").lower() in ["true", "1", "yes"]
+    # Modo de depuración: se habilita si la variable QUART_DEBUG es "True", "1" o "yes".
+    # Se acepta también FLASK_DEBUG para no romper los despliegues existentes.
+    DEBUG = os.getenv("QUART_DEBUG", os.getenv("FLASK_DEBUG", "False")).lower() in ["true", "1", "yes"]
     
     # Clave secreta para la aplicación (necesaria para el manejo de sesiones y CSRF).
     # Debe cambiarse en producción a un valor seguro y difícil de adivinar.
@@ -42,12 +43,12 @@ class Config:
     # Por ejemplo, se podría agregar la URL de una base de datos o endpoints externos.
     # DATABASE_URI = os.getenv("DATABASE_URI", "sqlite:///app.db")
 
-# Cómo utilizar esta configuración en su aplicación Flask:
+# Cómo utilizar esta configuración en su aplicación Quart:
 #
-# from flask import Flask
+# from quart import Quart
 # from config import Config
 #
-# app = Flask(__name__)
+# app = Quart(__name__)
 # app.config.from_object(Config)
 #
 # De esta manera, se cargan todas las configuraciones definidas en la clase Config
@@ -9,16 +9,24 @@ Utiliza el módulo 'logging' de Python para:
   - Establecer un formato de log que incluya la fecha, hora, nivel del mensaje,
     mensaje, y la ubicación (archivo y línea) desde donde se emitió.
   - Configurar además el log para que también se imprima en la consola.
+  - Escribir los logs desde un hilo en segundo plano (QueueHandler/QueueListener),
+    de modo que las peticiones solo encolan el registro y no esperan la escritura en disco.
 
 Buenas prácticas:
-  - Uso de 'basicConfig' para establecer la configuración inicial.
-  - Agregar un StreamHandler para que los logs se muestren en la consola,
-    lo que facilita la depuración durante el desarrollo.
+  - El logger raíz solo tiene un QueueHandler, que no bloquea el event loop del servidor.
+  - El QueueListener reparte los registros a un FileHandler y a un StreamHandler,
+    para que los logs también se muestren en la consola durante el desarrollo.
   - Comentarios y docstrings para facilitar la comprensión y mantenimiento.
 """
 
 import os
+import atexit
+import queue
 import logging
+import logging.handlers
+
+# Listener que escribe los registros encolados; se crea una sola vez por proceso
+_LISTENER = None
 
 def setup_logging():
     """
@@ -30,7 +38,17 @@ def setup_logging():
     - Define el formato del log con información de timestamp, nivel, mensaje,
       y ubicación en el código.
     - Añade también un handler para imprimir los mensajes en la consola.
+    - Conecta el logger raíz a una cola y escribe los registros desde un hilo aparte.
+
+    Llamadas sucesivas no vuelven a configurar el logging.
+
+    Returns:
+        logging.handlers.QueueListener: Listener que procesa la cola de registros.
     """
+    global _LISTENER
+    if _LISTENER is not None:
+        return _LISTENER
+
     # Definir el directorio donde se almacenarán los logs
     log_dir = "logs"
     if not os.path.exists(log_dir):
@@ -42,25 +60,34 @@ def setup_logging():
     # Formato del log: incluye fecha, hora, nivel, mensaje y origen (archivo y línea)
     log_format = '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
     
-    # Configurar el logging básico para escribir en el archivo de log
-    logging.basicConfig(
-        level=logging.INFO,
-        format=log_format,
-        filename=log_file,
-        filemode='a',  # 'a' para agregar mensajes al final del archivo (append)
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
+    formatter = logging.Formatter(log_format, datefmt='%Y-%m-%d %H:%M:%S')
+    
+    # Handler que escribe en el archivo de log
+    file_handler = logging.FileHandler(log_file, mode='a', encoding='utf-8')  # 'a' para agregar al final (append)
+    file_handler.setLevel(logging.INFO)
+    file_handler.setFormatter(formatter)
     
     # Configurar un StreamHandler para también enviar los logs a la consola
     console_handler = logging.StreamHandler()
     console_handler.setLevel(logging.INFO)
-    console_formatter = logging.Formatter(log_format)
-    console_handler.setFormatter(console_formatter)
+    console_handler.setFormatter(formatter)
     
-    # Añadir el handler de consola al logger raíz
-    logging.getLogger('').addHandler(console_handler)
+    # El logger raíz solo encola los registros (operación no bloqueante)
+    log_queue = queue.Queue(-1)
+    root_logger = logging.getLogger('')
+    root_logger.setLevel(logging.INFO)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    
+    # El listener escribe los registros en el archivo y la consola desde un hilo en segundo plano
+    _LISTENER = logging.handlers.QueueListener(
+        log_queue, file_handler, console_handler, respect_handler_level=True
+    )
+    _LISTENER.start()
+    # Vaciar la cola y detener el hilo al finalizar el proceso
+    atexit.register(_LISTENER.stop)
     
     logging.info("El sistema de logging se ha configurado correctamente.")
+    return _LISTENER
 
 # Si se ejecuta este módulo de forma independiente, se configura el logging y se emite un mensaje de prueba.
 if __name__ == "__main__":
@@ -1,80 +1,74 @@
-import json
+import orjson
 import os
+import shutil
 import logging
 
-# Definir la ruta del archivo JSON donde se almacenarán los registros.
+# Definir la ruta del archivo JSONL donde se almacenarán los registros.
+# Cada línea del archivo es un objeto JSON independiente (un guardia por línea), lo que permite
+# añadir registros sin leer ni reescribir el archivo completo.
 # Se utiliza os.path.join para construir la ruta de forma independiente al sistema operativo.
 # En este ejemplo, el archivo se ubicará en el directorio raíz del proyecto.
-JSON_FILE_PATH = os.path.join(os.path.dirname(__file__), "..", "guardias.json")
+JSONL_FILE_PATH = os.path.join(os.path.dirname(__file__), "..", "guardias.jsonl")
 
 def save_guardia(data):
     """
-    Guarda los datos de un guardia en el archivo JSON.
+    Guarda los datos de un guardia en el archivo JSONL.
     
-    Si el archivo ya existe, se lee el contenido actual (una lista de registros),
-    se añade el nuevo registro y se vuelve a escribir el archivo.
-    Si el archivo no existe o está vacío/corrupto, se crea uno nuevo con el registro inicial.
+    El registro se añade como una nueva línea al final del archivo, sin leer ni reescribir
+    los registros existentes. Si el archivo no existe, se crea con el registro inicial.
 
     Args:
         data (dict): Diccionario que contiene los datos del guardia (por ejemplo, nombre, apellidos, RUT).
 
     Raises:
-        Exception: Si ocurre algún error durante la escritura del archivo JSON.
+        Exception: Si ocurre algún error durante la escritura del archivo JSONL.
     """
     try:
-        # Inicializar la lista de guardias
-        guardias = []
-
-        # Si el archivo ya existe, leer el contenido actual
-        if os.path.exists(JSON_FILE_PATH):
-            with open(JSON_FILE_PATH, "r", encoding="utf-8") as f:
-                try:
-                    guardias = json.load(f)
-                except json.JSONDecodeError:
-                    # Si el archivo está vacío o corrupto, se continúa con una lista vacía
-                    guardias = []
-
-        # Añadir el nuevo registro a la lista
-        guardias.append(data)
-
-        # Escribir la lista actualizada en el archivo JSON con formato legible
-        with open(JSON_FILE_PATH, "w", encoding="utf-8") as f:
-            json.dump(guardias, f, ensure_ascii=False, indent=4)
+        # Añadir el nuevo registro como una línea al final del archivo.
+        # orjson serializa directamente a bytes UTF-8 (sin escapar caracteres no ASCII).
+        with open(JSONL_FILE_PATH, "ab") as f:
+            f.write(orjson.dumps(data) + b"\n")
 
-        logging.info("Registro guardado exitosamente en el archivo JSON.")
+        logging.info("Registro guardado exitosamente en el archivo JSONL.")
     except Exception as e:
         logging.error(f"Error al guardar el registro: {e}")
         raise Exception(f"Error al guardar el registro: {e}")
 
 def get_guardias():
     """
-    Lee y retorna la lista de guardias registrados desde el archivo JSON.
+    Lee y retorna la lista de guardias registrados desde el archivo JSONL.
+    
+    Las líneas vacías se ignoran, y las líneas corruptas (por ejemplo, por una escritura
+    interrumpida) se omiten registrando una advertencia, sin descartar el resto de registros.
     
     Returns:
         list: Lista de diccionarios, donde cada diccionario contiene los datos de un guardia.
               Si el archivo no existe o está vacío, se retorna una lista vacía.
 
     Raises:
-        Exception: Si ocurre algún error al leer el archivo JSON.
+        Exception: Si ocurre algún error al leer el archivo JSONL.
     """
     try:
-        if os.path.exists(JSON_FILE_PATH):
-            with open(JSON_FILE_PATH, "r", encoding="utf-8") as f:
-                try:
-                    guardias = json.load(f)
-                    return guardias
-                except json.JSONDecodeError:
-                    # El archivo está vacío o tiene un formato incorrecto; se retorna lista vacía
-                    return []
-        else:
-            return []
+        guardias = []
+        if os.path.exists(JSONL_FILE_PATH):
+            # Se lee en modo binario: orjson interpreta los bytes directamente, sin decodificar a str
+            with open(JSONL_FILE_PATH, "rb") as f:
+                for line_number, line in enumerate(f, start=1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        guardias.append(orjson.loads(line))
+                    except orjson.JSONDecodeError:
+                        logging.warning(f"Línea {line_number} con formato incorrecto en el archivo JSONL; se omite.")
+        return guardias
     except Exception as e:
-        logging.error(f"Error al leer el archivo JSON: {e}")
-        raise Exception(f"Error al leer el archivo JSON: {e}")
+        logging.error(f"Error al leer el archivo JSONL: {e}")
+        raise Exception(f"Error al leer el archivo JSONL: {e}")
 
 def clear_guardias():
     """
-    Elimina el archivo JSON que contiene los registros de guardias.
+    Elimina el archivo JSONL que contiene los registros de guardias.
     
     Se utiliza para limpiar o reiniciar el registro de datos. Si el archivo no existe,
     la función no realiza ninguna acción.
@@ -83,18 +77,21 @@ def clear_guardias():
         Exception: Si ocurre algún error al eliminar el archivo.
     """
     try:
-        if os.path.exists(JSON_FILE_PATH):
-            os.remove(JSON_FILE_PATH)
-            logging.info("Archivo JSON eliminado exitosamente.")
+        if os.path.exists(JSONL_FILE_PATH):
+            os.remove(JSONL_FILE_PATH)
+            logging.info("Archivo JSONL eliminado exitosamente.")
         else:
-            logging.info("El archivo JSON no existe, no se requiere eliminarlo.")
+            logging.info("El archivo JSONL no existe, no se requiere eliminarlo.")
     except Exception as e:
-        logging.error(f"Error al eliminar el archivo JSON: {e}")
-        raise Exception(f"Error al eliminar el archivo JSON: {e}")
+        logging.error(f"Error al eliminar el archivo JSONL: {e}")
+        raise Exception(f"Error al eliminar el archivo JSONL: {e}")
 
 def backup_guardias(backup_path):
     """
-    Realiza una copia de respaldo del archivo JSON en la ubicación especificada.
+    Realiza una copia de respaldo del archivo JSONL en la ubicación especificada.
+    
+    La copia se hace byte a byte por bloques, sin decodificar el contenido ni cargarlo
+    completo en memoria.
     
     Args:
         backup_path (str): Ruta completa donde se almacenará la copia de respaldo.
@@ -103,16 +100,13 @@ def backup_guardias(backup_path):
         Exception: Si ocurre algún error durante la operación de respaldo.
     """
     try:
-        if os.path.exists(JSON_FILE_PATH):
-            # Leer el contenido del archivo original
-            with open(JSON_FILE_PATH, "r", encoding="utf-8") as original:
-                data = original.read()
-            # Escribir el contenido en el archivo de respaldo
-            with open(backup_path, "w", encoding="utf-8") as backup_file:
-                backup_file.write(data)
+        if os.path.exists(JSONL_FILE_PATH):
+            # Copiar el archivo original en bloques de 1 MiB hacia el archivo de respaldo
+            with open(JSONL_FILE_PATH, "rb") as original, open(backup_path, "wb") as backup_file:
+                shutil.copyfileobj(original, backup_file, length=1 << 20)
             logging.info(f"Respaldo realizado exitosamente en: {backup_path}")
         else:
-            logging.info("No se realizó respaldo porque el archivo JSON no existe.")
+            logging.info("No se realizó respaldo porque el archivo JSONL no existe.")
     except Exception as e:
-        logging.error(f"Error al realizar el respaldo del archivo JSON: {e}")
-        raise Exception(f"Error al realizar el respaldo del archivo JSON: {e}")
+        logging.error(f"Error al realizar el respaldo del archivo JSONL: {e}")
+        raise Exception(f"Error al realizar el respaldo del archivo JSONL: {e}")
@@ -4,24 +4,118 @@ utils/ocr_processor.py
 Este módulo contiene funciones para:
 - Descargar un archivo (en este caso, una imagen enviada por WhatsApp) a partir de su URL.
 - Preprocesar la imagen utilizando OpenCV para optimizar la extracción de texto.
-- Extraer texto de la imagen utilizando Pytesseract.
+- Extraer texto de la imagen utilizando Tesseract (tesserocr en el mismo proceso, o Pytesseract).
 - Procesar el texto extraído para obtener datos específicos (por ejemplo, RUT).
 
+La descarga y el procesamiento son corrutinas para no bloquear el event loop del servidor ASGI;
+el trabajo de CPU (OpenCV y Tesseract) se delega a un pool de hilos dedicado mediante run_in_executor.
+
 Se utilizan buenas prácticas como el manejo de excepciones, docstrings y comentarios explicativos.
 """
 
+import asyncio
+import hashlib
+import logging
+import os
+import threading
 import cv2
 import numpy as np
 import pytesseract
-import requests
+import httpx
 import io
 from pdf2image import convert_from_bytes
 from PIL import Image
+from pypdf import PdfReader
 import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Limitar Tesseract a un hilo de OpenMP por imagen. El paralelismo lo da el pool _OCR_EXECUTOR
+# (OCR_WORKERS hilos por worker de Gunicorn); si además cada OCR abriera un hilo por núcleo,
+# la CPU quedaría sobresuscrita. Debe definirse antes de cargar libtesseract (tesserocr) y se
+# hereda en los subprocesos de Pytesseract. Se respeta el valor si ya está definido.
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+# tesserocr expone la API C++ de Tesseract dentro del proceso, evitando lanzar el binario
+# 'tesseract' y recargar el modelo 'spa' en cada llamada. Es opcional (requirements-ocr.txt);
+# si no está instalado se utiliza Pytesseract como alternativa.
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+# Caché de resultados de OCR indexada por el SHA-256 del archivo descargado.
+# Evita repetir todo el pipeline (pdf2image, OpenCV y Tesseract) cuando Twilio reintenta
+# un webhook o el usuario reenvía el mismo documento. Se limita a las entradas usadas
+# más recientemente y solo se accede desde el event loop, por lo que no requiere bloqueo.
+OCR_CACHE_MAX_ENTRIES = 256
+_OCR_CACHE = OrderedDict()
+
+# Procesamientos en curso indexados por URL del medio. Si Twilio reintenta un webhook
+# mientras el primero aún se procesa, la nueva petición espera la misma tarea en lugar de
+# descargar y aplicar OCR otra vez. Al igual que la caché, solo se usa desde el event loop.
+_INFLIGHT = {}
+
+# Cantidad mínima de caracteres alfanuméricos para considerar que la capa de texto de un PDF
+# es utilizable. Por debajo de este umbral (por ejemplo, PDFs escaneados) se recurre al OCR.
+PDF_TEXT_LAYER_MIN_CHARS = 50
 
-def download_file(url):
+# Pool de hilos dedicado al preprocesamiento y al OCR. Cada hilo conserva su propia instancia
+# de Tesseract (las instancias no son seguras entre hilos), de modo que su inicialización se
+# paga una sola vez por hilo. tesserocr libera el GIL durante el reconocimiento, por lo que
+# los hilos procesan imágenes en paralelo. Cada hilo usa un único hilo de OpenMP
+# (OMP_THREAD_LIMIT=1), por lo que OCR_WORKERS x workers de Gunicorn no debería superar los núcleos.
+# Por defecto los núcleos se reparten entre los WEB_CONCURRENCY workers (ver Procfile), lo que
+# también acota la memoria: cada hilo mantiene cargado su propio modelo 'spa' (~30-50 MB).
+OCR_WORKERS = int(os.getenv(
+    "OCR_WORKERS", max(1, (os.cpu_count() or 1) // int(os.getenv("WEB_CONCURRENCY", "2")))
+))
+_OCR_EXECUTOR = ThreadPoolExecutor(max_workers=OCR_WORKERS, thread_name_prefix="ocr")
+_TESSERACT = threading.local()
+
+# Prefijos de los tipos MIME que se pueden procesar mediante OCR
+SUPPORTED_MEDIA_TYPES = ("image/", "application/pdf")
+
+# Dimensión máxima (en píxeles, para el lado mayor) de las imágenes recibidas por WhatsApp.
+# Las fotos de smartphone suelen superar los 3000x4000 píxeles y el costo de Tesseract crece
+# con la cantidad de píxeles, por lo que se reducen antes del preprocesamiento. No se aplica
+# a los PDFs rasterizados, que ya se generan a la resolución elegida (200 dpi).
+OCR_MAX_DIMENSION = 1600
+
+# Expresiones regulares compiladas una sola vez al importar el módulo
+# RUT en formato chileno (ejemplo: 12.345.678-9)
+_RUT_RE = re.compile(r'\d{1,2}\.\d{3}\.\d{3}-[\dkK]')
+# Caracteres alfanuméricos, usados para evaluar la capa de texto de los PDFs
+_ALNUM_RE = re.compile(r'[A-Za-z0-9]')
+
+# Cliente HTTP compartido para todas las descargas. Las URLs de medios de Twilio apuntan
+# siempre al mismo host, por lo que reutilizar las conexiones (keep-alive y HTTP/2) evita
+# repetir el handshake TCP + TLS en cada webhook.
+_TWILIO_AUTH = (
+    (os.getenv("TWILIO_ACCOUNT_SID"), os.getenv("TWILIO_AUTH_TOKEN"))
+    if os.getenv("TWILIO_ACCOUNT_SID") and os.getenv("TWILIO_AUTH_TOKEN")
+    else None
+)
+HTTP_CLIENT = httpx.AsyncClient(
+    http2=True,
+    # Twilio redirige las URLs de medios a su CDN, por lo que se siguen las redirecciones
+    follow_redirects=True,
+    auth=_TWILIO_AUTH,
+    timeout=httpx.Timeout(10.0, connect=2.0),
+    limits=httpx.Limits(max_connections=50, max_keepalive_connections=10),
+)
+
+async def close_http_client():
     """
-    Descarga un archivo desde una URL y devuelve su contenido en bytes.
+    Cierra el cliente HTTP compartido y libera sus conexiones.
+    
+    Debe llamarse al detener la aplicación (por ejemplo, en el hook after_serving de Quart).
+    """
+    await HTTP_CLIENT.aclose()
+
+async def download_file(url):
+    """
+    Descarga de forma asíncrona un archivo desde una URL y devuelve su contenido en bytes.
     
     En el caso de este proyecto, la URL proviene de la imagen enviada a través de WhatsApp
     (Twilio envía el parámetro 'MediaUrl0' en el webhook).
@@ -36,12 +130,29 @@ def download_file(url):
         Exception: Si ocurre un error durante la descarga.
     """
     try:
-        response = requests.get(url)
+        response = await HTTP_CLIENT.get(url)
         response.raise_for_status()  # Lanza una excepción para códigos de error HTTP.
         return response.content
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         raise Exception(f"Error al descargar el archivo desde {url}: {e}")
 
+def is_supported_media(content_type):
+    """
+    Indica si un tipo de contenido informado por Twilio puede procesarse mediante OCR.
+    
+    Solo se procesan imágenes y PDFs; otros medios (audio, video, etc.) se descartan sin
+    descargarlos. Si Twilio no informa el tipo, se intenta procesar el archivo de todas formas.
+    
+    Args:
+        content_type (str): Tipo MIME del medio (parámetro MediaContentTypeN del webhook).
+    
+    Returns:
+        bool: True si es una imagen, un PDF o un tipo desconocido, False en caso contrario.
+    """
+    if not content_type:
+        return True
+    return content_type.lower().startswith(SUPPORTED_MEDIA_TYPES)
+
 def is_pdf(file_bytes):
     """
     Determina si el contenido del archivo corresponde a un PDF.
@@ -56,37 +167,91 @@ def is_pdf(file_bytes):
     """
     return file_bytes[:4] == b'%PDF'
 
+def extract_pdf_text_layer(file_bytes):
+    """
+    Extrae directamente la capa de texto de la primera página de un PDF utilizando pypdf.
+    
+    Muchos PDFs (por ejemplo, documentos o formularios generados electrónicamente) ya incluyen
+    el texto, por lo que no es necesario rasterizarlos ni aplicar OCR. Este paso es solo una
+    optimización: ante cualquier error de pypdf se retorna None para que se aplique el OCR.
+    
+    Args:
+        file_bytes (bytes): Contenido del archivo PDF.
+    
+    Returns:
+        str: Texto extraído si contiene suficientes caracteres alfanuméricos, o None en caso contrario.
+    """
+    try:
+        reader = PdfReader(io.BytesIO(file_bytes))
+        if not reader.pages:
+            return None
+        text = reader.pages[0].extract_text() or ""
+    except Exception as e:
+        # PDF dañado o no soportado por pypdf (puede lanzar PyPdfError, KeyError, ValueError,
+        # zlib.error, etc.); se intentará rasterizarlo y aplicar OCR
+        logging.debug(f"No se pudo leer la capa de texto del PDF: {e}")
+        return None
+    
+    if len(_ALNUM_RE.findall(text)) < PDF_TEXT_LAYER_MIN_CHARS:
+        return None
+    return text
+
 def preprocess_image_cv2(cv_image):
     """
     Aplica técnicas de preprocesamiento a una imagen utilizando OpenCV.
     
     Este preprocesamiento incluye:
-      - Conversión a escala de grises.
-      - Aplicación de desenfoque gaussiano para reducir el ruido.
-      - Umbralización (binaria mediante el método de Otsu) para resaltar el texto.
+      - Conversión a escala de grises (se omite si la imagen ya tiene un solo canal).
+      - Filtro de mediana 3x3 para reducir el ruido.
+      - Umbralización adaptativa (gaussiana) para resaltar el texto. A diferencia de Otsu,
+        el umbral se calcula por vecindario, lo que tolera la iluminación irregular y los
+        reflejos habituales en las fotos tomadas con el teléfono.
     
     Args:
-        cv_image (numpy.ndarray): Imagen en formato OpenCV (BGR).
+        cv_image (numpy.ndarray): Imagen en formato OpenCV (BGR) o en escala de grises.
     
     Returns:
         numpy.ndarray: Imagen preprocesada lista para el OCR.
     """
-    # Convertir la imagen a escala de grises
-    gray = cv2.cvtColor(cv_image, cv2.COLOR_BGR2GRAY)
+    # Convertir la imagen a escala de grises si aún tiene canales de color
+    if cv_image.ndim == 2:
+        gray = cv_image
+    else:
+        gray = cv2.cvtColor(cv_image, cv2.COLOR_BGR2GRAY)
     
-    # Aplicar desenfoque gaussiano para reducir el ruido
-    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    # Aplicar un filtro de mediana para reducir el ruido (más barato que el desenfoque gaussiano 5x5)
+    denoised = cv2.medianBlur(gray, 3)
     
-    # Aplicar umbralización con el método de Otsu
-    _, thresh = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    # Aplicar umbralización adaptativa sobre vecindarios de 31x31 píxeles
+    thresh = cv2.adaptiveThreshold(
+        denoised, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, blockSize=31, C=10
+    )
     
     return thresh
 
+def _get_tesseract_api():
+    """
+    Retorna la instancia de Tesseract del hilo actual, creándola en su primer uso.
+    
+    Returns:
+        tesserocr.PyTessBaseAPI: Instancia inicializada con el idioma 'spa', o None si
+        tesserocr no está disponible.
+    """
+    if tesserocr is None:
+        return None
+    api = getattr(_TESSERACT, "api", None)
+    if api is None:
+        api = tesserocr.PyTessBaseAPI(lang='spa')
+        _TESSERACT.api = api
+    return api
+
 def extract_text_from_image(cv_image):
     """
-    Extrae texto de una imagen preprocesada utilizando Pytesseract.
+    Extrae texto de una imagen preprocesada utilizando Tesseract.
     
     Se especifica el idioma 'spa' para optimizar el reconocimiento de texto en español.
+    Si tesserocr está disponible se reutiliza la instancia de Tesseract del hilo actual;
+    en caso contrario se recurre a Pytesseract, que lanza el binario en cada llamada.
     
     Args:
         cv_image (numpy.ndarray): Imagen preprocesada lista para OCR.
@@ -94,57 +259,156 @@ def extract_text_from_image(cv_image):
     Returns:
         str: Texto extraído de la imagen.
     """
-    text = pytesseract.image_to_string(cv_image, lang='spa')
-    return text
+    api = _get_tesseract_api()
+    if api is None:
+        return pytesseract.image_to_string(cv_image, lang='spa')
+    api.SetImage(Image.fromarray(cv_image))
+    return api.GetUTF8Text()
 
-def process_media(media_url):
+def extract_text_from_bytes(file_bytes, content_type=None):
     """
-    Procesa un medio (en este caso, una imagen enviada por WhatsApp) a partir de su URL.
-    
-    La función realiza los siguientes pasos:
-      1. Descarga el archivo desde la URL (se espera que la URL provenga de Twilio en el webhook).
-      2. Determina si el archivo es un PDF o una imagen.
-         - Si es un PDF, utiliza pdf2image para convertir la primera página a imagen.
-         - Si es una imagen, la decodifica utilizando OpenCV.
-      3. Preprocesa la imagen para mejorar la calidad para el OCR.
-      4. Extrae el texto de la imagen preprocesada mediante Pytesseract.
-    
+    Convierte el contenido de un archivo (PDF o imagen) en texto mediante OCR.
+
+    Esta función concentra el trabajo intensivo en CPU (pdf2image, OpenCV y Tesseract),
+    por lo que es síncrona y se ejecuta fuera del event loop desde process_media.
+    Los PDFs con capa de texto se leen directamente con pypdf, sin rasterizar ni aplicar OCR.
+
     Args:
-        media_url (str): URL del archivo a procesar.
-    
+        file_bytes (bytes): Contenido del archivo descargado.
+        content_type (str): Tipo MIME informado por Twilio (MediaContentTypeN). Si se indica,
+            se usa para distinguir PDFs de imágenes sin inspeccionar el contenido.
+
     Returns:
         str: Texto extraído mediante OCR.
-    
+
     Raises:
-        Exception: Si ocurre algún error durante la descarga o el procesamiento.
+        Exception: Si el archivo no se puede convertir o decodificar como imagen.
     """
-    # Descargar el archivo desde la URL (esta URL es recibida desde WhatsApp a través de Twilio)
-    file_bytes = download_file(media_url)
-    
-    # Determinar si el archivo es un PDF
-    if is_pdf(file_bytes):
-        # Convertir el PDF a imagen (se utiliza solo la primera página para simplificar)
-        pil_images = convert_from_bytes(file_bytes, dpi=300)
+    # Determinar si el archivo es un PDF (según el tipo informado por Twilio o, si no se conoce,
+    # según el encabezado del archivo)
+    pdf = content_type.lower().startswith("application/pdf") if content_type else is_pdf(file_bytes)
+    if pdf:
+        # Si el PDF ya tiene una capa de texto, se retorna directamente sin OCR
+        text_layer = extract_pdf_text_layer(file_bytes)
+        if text_layer is not None:
+            return text_layer
+        # Convertir el PDF a imagen (se utiliza solo la primera página para simplificar).
+        # Se rasteriza únicamente esa página, a 200 dpi, suficiente para Tesseract y con
+        # menos memoria que 300 dpi. Con una sola página basta un hilo de Poppler.
+        # Poppler genera directamente la imagen en escala de grises.
+        pil_images = convert_from_bytes(
+            file_bytes, dpi=200, first_page=1, last_page=1, thread_count=1, grayscale=True
+        )
         if not pil_images:
             raise Exception("No se pudo convertir el PDF a imagen.")
         pil_image = pil_images[0]
-        # Convertir la imagen PIL a un formato compatible con OpenCV (BGR)
-        cv_image = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
+        # Convertir la imagen PIL a un arreglo NumPy de un solo canal compatible con OpenCV
+        cv_image = np.asarray(pil_image.convert("L"))
     else:
         # Asumir que es una imagen (por ejemplo, JPEG o PNG) enviada por WhatsApp
-        # Convertir los bytes a un arreglo NumPy y decodificar la imagen
+        # Convertir los bytes a un arreglo NumPy y decodificar la imagen directamente en
+        # escala de grises (un tercio de la memoria de BGR y sin conversión posterior)
         np_array = np.frombuffer(file_bytes, np.uint8)
-        cv_image = cv2.imdecode(np_array, cv2.IMREAD_COLOR)
+        cv_image = cv2.imdecode(np_array, cv2.IMREAD_GRAYSCALE)
         if cv_image is None:
             raise Exception("No se pudo decodificar la imagen.")
+        # Reducir las fotos grandes manteniendo la proporción (INTER_AREA evita el aliasing)
+        height, width = cv_image.shape[:2]
+        scale = min(1.0, OCR_MAX_DIMENSION / max(height, width))
+        if scale < 1.0:
+            cv_image = cv2.resize(cv_image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
     
     # Preprocesar la imagen para mejorar el rendimiento del OCR
     preprocessed_image = preprocess_image_cv2(cv_image)
     
     # Extraer y devolver el texto de la imagen preprocesada
-    extracted_text = extract_text_from_image(preprocessed_image)
+    return extract_text_from_image(preprocessed_image)
+
+def _get_cached_text(key):
+    """
+    Retorna el texto almacenado en la caché de OCR para la clave dada, o None si no existe.
+    """
+    text = _OCR_CACHE.get(key)
+    if text is not None:
+        # Marcar la entrada como usada recientemente
+        _OCR_CACHE.move_to_end(key)
+    return text
+
+def _set_cached_text(key, text):
+    """
+    Almacena el texto extraído en la caché de OCR, descartando la entrada más antigua si se supera el límite.
+    """
+    _OCR_CACHE[key] = text
+    _OCR_CACHE.move_to_end(key)
+    if len(_OCR_CACHE) > OCR_CACHE_MAX_ENTRIES:
+        _OCR_CACHE.popitem(last=False)
+
+async def _download_and_extract(media_url, use_cache, content_type):
+    """
+    Descarga el medio y extrae su texto, consultando la caché de OCR si corresponde.
+    
+    Ver process_media para la descripción de los pasos y los argumentos.
+    """
+    # Descargar el archivo desde la URL (esta URL es recibida desde WhatsApp a través de Twilio)
+    file_bytes = await download_file(media_url)
+    
+    # Buscar el resultado en la caché usando el hash del contenido como clave
+    cache_key = hashlib.sha256(file_bytes).hexdigest()
+    if use_cache:
+        cached_text = _get_cached_text(cache_key)
+        if cached_text is not None:
+            return cached_text
+    
+    # Ejecutar el preprocesamiento y el OCR fuera del event loop
+    loop = asyncio.get_running_loop()
+    extracted_text = await loop.run_in_executor(
+        _OCR_EXECUTOR, extract_text_from_bytes, file_bytes, content_type
+    )
+    
+    if use_cache:
+        _set_cached_text(cache_key, extracted_text)
     return extracted_text
 
+async def process_media(media_url, use_cache=True, content_type=None):
+    """
+    Procesa un medio (en este caso, una imagen enviada por WhatsApp) a partir de su URL.
+    
+    La función realiza los siguientes pasos:
+      1. Descarga el archivo desde la URL sin bloquear el event loop
+         (se espera que la URL provenga de Twilio en el webhook).
+      2. Determina si el archivo es un PDF o una imagen.
+         - Si es un PDF con capa de texto, la extrae con pypdf y omite los pasos 3 y 4.
+         - Si es un PDF sin texto, utiliza pdf2image para convertir la primera página a imagen.
+         - Si es una imagen, la decodifica utilizando OpenCV.
+      3. Preprocesa la imagen para mejorar la calidad para el OCR.
+      4. Extrae el texto de la imagen preprocesada mediante Tesseract.
+    
+    Los pasos 2 a 4 se ejecutan en el pool de hilos de OCR para que el
+    trabajo de CPU no detenga la atención de otros webhooks. Si el contenido del
+    archivo ya fue procesado antes, se retorna el texto almacenado en la caché.
+    Si la misma URL ya se está procesando (por ejemplo, por un reintento de Twilio),
+    se espera el resultado de ese procesamiento en lugar de repetirlo.
+    
+    Args:
+        media_url (str): URL del archivo a procesar.
+        use_cache (bool): Si es True (por defecto), se consulta y actualiza la caché de OCR.
+        content_type (str): Tipo MIME informado por Twilio para el archivo (opcional).
+    
+    Returns:
+        str: Texto extraído mediante OCR.
+    
+    Raises:
+        Exception: Si ocurre algún error durante la descarga o el procesamiento.
+    """
+    task = _INFLIGHT.get(media_url)
+    if task is None:
+        task = asyncio.ensure_future(_download_and_extract(media_url, use_cache, content_type))
+        _INFLIGHT[media_url] = task
+        # Quitar la tarea del mapa al terminar, tanto si tuvo éxito como si falló
+        task.add_done_callback(lambda _: _INFLIGHT.pop(media_url, None))
+    # shield evita que la cancelación de una petición cancele el trabajo compartido con las demás
+    return await asyncio.shield(task)
+
 def parse_extracted_text(text):
     """
     Procesa el texto extraído para obtener datos específicos, como nombre, apellidos y RUT.
@@ -159,9 +423,8 @@ def parse_extracted_text(text):
         dict: Diccionario con los datos extraídos, por ejemplo:
               {'nombre': 'NombreExtraido', 'apellidos': 'ApellidosExtraidos', 'rut': '12.345.678-9'}
     """
-    # Expresión regular para extraer un RUT (ejemplo: 12.345.678-9)
-    rut_pattern = r'\d{1,2}\.\d{3}\.\d{3}-[\dkK]'
-    rut_match = re.search(rut_pattern, text)
+    # Buscar un RUT (ejemplo: 12.345.678-9) con la expresión regular precompilada
+    rut_match = _RUT_RE.search(text)
     rut = rut_match.group(0) if rut_match else None
     
     # En este ejemplo, los datos de nombre y apellidos se asignan de forma dummy.
@@ -1,12 +1,79 @@
 
 import os
 import logging
+import threading
+import httpx
+from twilio.http import HttpClient
+from twilio.http.response import Response
 from twilio.rest import Client
 
+# Número asignado a WhatsApp, leído una sola vez al importar el módulo
+FROM_NUMBER = os.getenv("TWILIO_WHATSAPP_NUMBER")
+
+# Cliente de Twilio compartido por todo el proceso. Se crea de forma perezosa en el primer
+# envío y se reutiliza después, conservando su sesión HTTP y las conexiones TLS abiertas.
+# Los envíos se ejecutan en hilos del executor, por lo que la creación se protege con un lock.
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+class Http2TwilioHttpClient(HttpClient):
+    """
+    Cliente HTTP para la API de Twilio basado en httpx.
+
+    Reemplaza al TwilioHttpClient por defecto (requests sobre HTTP/1.1): negocia HTTP/2 para
+    multiplexar los envíos sobre una misma conexión con api.twilio.com, acepta respuestas
+    comprimidas (gzip/brotli) y reintenta los errores de conexión.
+    """
+
+    def __init__(self, timeout=None, max_retries=3, logger=logging.getLogger("twilio.http_client")):
+        """
+        Args:
+            timeout (float): Tiempo máximo (en segundos) por petición. Si es None se usan 10 segundos.
+            max_retries (int): Cantidad de reintentos ante errores de conexión.
+            logger (logging.Logger): Logger donde se registran las peticiones y respuestas.
+        """
+        super().__init__(logger, False, timeout)
+        self.session = httpx.Client(
+            transport=httpx.HTTPTransport(http2=True, retries=max_retries),
+            timeout=timeout if timeout is not None else 10.0,
+        )
+
+    def request(self, method, url, params=None, data=None, headers=None, auth=None,
+                timeout=None, allow_redirects=False):
+        """
+        Realiza una petición HTTP a la API de Twilio y retorna la respuesta en el formato de la librería.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        elif timeout <= 0:
+            raise ValueError(timeout)
+
+        kwargs = {
+            "method": method.upper(),
+            "url": url,
+            "params": params,
+            "data": data,
+            "headers": headers,
+        }
+        self.log_request(kwargs)
+
+        response = self.session.request(
+            auth=auth,
+            follow_redirects=allow_redirects,
+            timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT,
+            **kwargs
+        )
+        self.log_response(response.status_code, response)
+
+        self._test_only_last_response = Response(
+            int(response.status_code), response.text, response.headers
+        )
+        return self._test_only_last_response
+
 def get_twilio_client():
     """
-    Inicializa y retorna una instancia del cliente de Twilio utilizando
-    las credenciales definidas en las variables de entorno.
+    Retorna la instancia compartida del cliente de Twilio, creándola la primera vez
+    con las credenciales definidas en las variables de entorno.
 
     Returns:
         Client: Instancia del cliente de Twilio.
@@ -14,11 +81,17 @@ def get_twilio_client():
     Raises:
         Exception: Si las credenciales necesarias no se encuentran configuradas.
     """
-    account_sid = os.getenv("TWILIO_ACCOUNT_SID")
-    auth_token = os.getenv("TWILIO_AUTH_TOKEN")
-    if not account_sid or not auth_token:
-        raise Exception("Las credenciales de Twilio no están configuradas correctamente en las variables de entorno.")
-    return Client(account_sid, auth_token)
+    global _CLIENT
+    if _CLIENT is None:
+        with _CLIENT_LOCK:
+            # Volver a comprobar dentro del lock por si otro hilo ya creó el cliente
+            if _CLIENT is None:
+                account_sid = os.getenv("TWILIO_ACCOUNT_SID")
+                auth_token = os.getenv("TWILIO_AUTH_TOKEN")
+                if not account_sid or not auth_token:
+                    raise Exception("Las credenciales de Twilio no están configuradas correctamente en las variables de entorno.")
+                _CLIENT = Client(account_sid, auth_token, http_client=Http2TwilioHttpClient(max_retries=3))
+    return _CLIENT
 
 def send_message(to, body):
     """
@@ -36,13 +109,12 @@ def send_message(to, body):
     """
     try:
         client = get_twilio_client()
-        # Se obtiene el número asignado a WhatsApp desde las variables de entorno
-        from_number = os.getenv("TWILIO_WHATSAPP_NUMBER")
-        if not from_number:
+        # Se utiliza el número asignado a WhatsApp leído de las variables de entorno
+        if not FROM_NUMBER:
             raise Exception("El número de WhatsApp de Twilio no está configurado en las variables de entorno.")
         message = client.messages.create(
             body=body,
-            from_=from_number,
+            from_=FROM_NUMBER,
             to=to
         )
         logging.info(f"Mensaje enviado a {to}. SID: {message.sid}")